@@ -179,6 +179,126 @@ int("a", 16)      # => 10
 int("A", 16)      # => 10
 
 
+# Converting many numbers at once
+
+# Reference: https://docs.python.org/3/library/binascii.html#binascii.unhexlify
+# Reference: https://docs.python.org/3/library/array.html
+
+# IDs read from files arrive as bytes. int accepts bytes, so no str is created,
+# and the results are stored in an array of unsigned 64 bits integers ("Q").
+# When every ID has all its digits (16 in hexadecimal or 64 in binary) the
+# whole buffer is converted at once: unhexlify, or a single int in base 2 that
+# is then cut in 8 bytes pieces.
+
+import binascii
+import sys
+from array import array
+from itertools import repeat
+
+WHITESPACE = b" \t\n\r\x0b\x0c"
+FIXED_WIDTHS = {2: 64, 16: 16}  # Digits of a 64 bits number
+FORMATS = {2: "b", 8: "o", 16: "x"}
+DIGITS = b"0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def check_digits(data: bytes, base: int) -> None:
+    """int also accepts signs, "_" and prefixes such as "0x", IDs only have digits"""
+    if not 2 <= base <= 36:
+        raise ValueError(f"Base must be between 2 and 36, not {base}")
+    allowed = DIGITS[:base] + DIGITS[10:base].upper()
+    if data.translate(None, allowed + WHITESPACE):
+        raise ValueError(f"IDs must only have digits of base {base}")
+
+
+def parse_numbers(data: bytes, base: int) -> array:
+    """IDs of any width separated by whitespace"""
+    check_digits(data, base)
+    return array("Q", list(map(int, data.split(), repeat(base))))
+
+
+def parse_fixed_width(data: bytes, base: int) -> array:
+    """IDs with 16 hexadecimal or 64 binary digits each, separated by one whitespace"""
+    if base not in FIXED_WIDTHS:
+        raise ValueError(f"Fixed width IDs are only supported in base 2 and 16, not {base}")
+    width = FIXED_WIDTHS[base]
+    data = data.strip(WHITESPACE)
+    if not data:
+        return array("Q")
+    count, remainder = divmod(len(data) + 1, width + 1)
+    separators = data[width :: width + 1]  # Checked with slices, no loop over the IDs
+    check_digits(data, base)
+    digits = data.translate(None, WHITESPACE)
+    if remainder or separators.translate(None, WHITESPACE) or len(digits) != count * width:
+        raise ValueError(f"Every ID must have {width} digits in base {base}")
+    if base == 16:
+        raw = binascii.unhexlify(digits)
+    else:
+        raw = int(digits, 2).to_bytes(len(digits) // 8, "big")
+    numbers = array("Q")
+    numbers.frombytes(raw)
+    if sys.byteorder == "little":
+        numbers.byteswap()  # The digits are written with the most significant first
+    return numbers
+
+
+def format_numbers(numbers: array, base: int, width: int = 0) -> bytes:
+    spec = f"0{width}{FORMATS[base]}" if width else FORMATS[base]
+    return "\n".join(map(format, numbers, repeat(spec))).encode("ascii")
+
+
+ids = b"a\nff 10\n"
+parse_numbers(ids, 16)                          # => array('Q', [10, 255, 16])
+parse_numbers(b"1010 12", 8)                    # => array('Q', [520, 10])
+format_numbers(parse_numbers(ids, 16), 2)       # => b'1010\n11111111\n10000'
+format_numbers(array("Q", [10, 255]), 16, 16)   # => b'000000000000000a\n00000000000000ff'
+
+assert list(parse_numbers(ids, 16)) == [int("a", 16), int("ff", 16), int("10", 16)]
+for base in (2, 8, 16):
+    assert parse_numbers(format_numbers(array("Q", [0, 10, 2**64 - 1]), base), base) == array("Q", [0, 10, 2**64 - 1])
+for base, width in ((2, 64), (16, 16)):
+    fixed = format_numbers(array("Q", [0, 10, 2**64 - 1]), base, width)
+    assert parse_fixed_width(fixed, base) == array("Q", [0, 10, 2**64 - 1])
+# parse_fixed_width(b"00ff 00ff 00ff 00ff", 16)  # => ValueError | IDs of 4 digits
+# parse_numbers(b"0xff f_f -1", 16)              # => ValueError | Only digits
+for bad in (b"0xff", b"f_f", b"+ff", b"-1"):
+    try:
+        parse_numbers(bad, 16)
+        assert False, bad
+    except ValueError:
+        pass
+binary = format_numbers(array("Q", [10]), 2, 64)
+for bad in (b"_" + binary[1:], b"+" + binary[1:], b"-" + binary[1:]):
+    try:
+        parse_fixed_width(bad, 2)
+        assert False, bad
+    except ValueError:
+        pass
+
+
+# Benchmark with 1_000_000 hexadecimal IDs, run with BENCHMARK=1
+
+import random
+
+from performance import RUN_BENCHMARKS, benchmark
+
+if RUN_BENCHMARKS:
+    random.seed(42)
+    hex_ids = format_numbers(array("Q", (random.getrandbits(64) for _ in range(1_000_000))), 16, 16)
+    hex_strings = hex_ids.decode("ascii").split("\n")
+
+    benchmark({
+        "Loop of int(s, 16)": lambda: [int(string, 16) for string in hex_strings],
+        "parse_numbers": lambda: parse_numbers(hex_ids, 16),
+        "parse_fixed_width": lambda: parse_fixed_width(hex_ids, 16),
+    })
+    del hex_ids, hex_strings
+
+# Results, the loop starts from strings already split
+# Loop of int(s, 16): 0.112s
+#      parse_numbers: 0.180s  Includes the split and int is slower with bytes
+#  parse_fixed_width: 0.019s  Includes checking the width of every ID
+
+
 ####################################################
 # 1.7 String conversions to Unicode
 ####################################################
@@ -204,3 +324,71 @@ ord("€")   # => 8364
 
 # More on Bit Operations on Anurag Verma's post:
 # https://www.anurag629.club/posts/the-power-of-bit-manipulation-how-to-solve-problems-efficiently
+
+
+# Bitwise operations on many numbers at once
+
+# Reference: https://docs.python.org/3/library/functions.html#bin
+
+# The array of 64 bits numbers is read as one big int, then AND, OR, XOR and
+# NOT run once over all the numbers. Shifts move bits between neighbours, the
+# mask applied afterwards clears them.
+
+from typing import Callable
+
+MASK = 2**64 - 1
+
+
+def as_int(numbers: array) -> int:
+    return int.from_bytes(numbers.tobytes(), sys.byteorder)
+
+
+def as_numbers(value: int, count: int) -> array:
+    numbers = array("Q")
+    numbers.frombytes(value.to_bytes(count * 8, sys.byteorder))
+    return numbers
+
+
+def repeated(value: int, count: int) -> int:
+    return as_int(array("Q", [value]) * count)
+
+
+def bitwise(numbers: array, operation: Callable[[int, int], int], operand: int) -> array:
+    """operation is and_, or_ or xor from the operator module"""
+    return as_numbers(operation(as_int(numbers), repeated(operand, len(numbers))), len(numbers))
+
+
+def invert(numbers: array) -> array:  # ~ for unsigned numbers
+    return bitwise(numbers, xor, MASK)
+
+
+def shift(numbers: array, bits: int) -> array:
+    """Left shift for positive bits, right shift for negative bits"""
+    if bits >= 0:
+        shifted, mask = as_int(numbers) << bits, (MASK << bits) & MASK
+    else:
+        shifted, mask = as_int(numbers) >> -bits, MASK >> -bits
+    return as_numbers(shifted & repeated(mask, len(numbers)), len(numbers))
+
+
+def popcount(numbers: array) -> array:
+    return array("B", [bin(number).count("1") for number in numbers])  # int.bit_count in 3.10+
+
+
+from operator import and_, or_, xor
+
+numbers = array("Q", [10, 9, 2**64 - 1])
+invert(numbers)            # => array('Q', [18446744073709551605, 18446744073709551606, 0])
+bitwise(numbers, and_, 9)  # => array('Q', [8, 9, 9])
+bitwise(numbers, or_, 9)   # => array('Q', [11, 9, 18446744073709551615])
+bitwise(numbers, xor, 9)   # => array('Q', [3, 0, 18446744073709551606])
+shift(numbers, -1)         # => array('Q', [5, 4, 9223372036854775807])
+shift(numbers, 1)          # => array('Q', [20, 18, 18446744073709551614])
+popcount(numbers)          # => array('B', [2, 2, 64])
+
+for operation in (and_, or_, xor):
+    assert list(bitwise(numbers, operation, 9)) == [operation(number, 9) for number in numbers]
+assert list(invert(numbers)) == [~number & MASK for number in numbers]
+assert list(shift(numbers, 3)) == [(number << 3) & MASK for number in numbers]
+assert list(shift(numbers, -3)) == [number >> 3 for number in numbers]
+assert list(popcount(numbers)) == [bin(number).count("1") for number in numbers]
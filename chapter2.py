@@ -226,6 +226,270 @@ some_set.isdisjoint(other_set)             # => False
 some_set.intersection(extra_set) == set() # => True
 some_set.isdisjoint(extra_set)            # => True
 
+
+# Sets of many integers stored as bits
+
+# Reference: https://docs.python.org/3/library/collections.abc.html#collections.abc.MutableSet
+
+# A set stores every integer as an object plus an entry in a hash table, more
+# than 50 bytes each. A BitSet stores one bit per possible integer: the integer
+# n is in the set when the bit n of the bytearray is 1. The set operations read
+# the whole bytearray as a single int and use the bitwise operators, so they
+# run in C over 8 integers per byte.
+
+from collections.abc import Iterable, Iterator, MutableSet, Set
+from typing import Tuple
+
+BIT_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+class BitSet(MutableSet):
+    """Set of non-negative integers, only dense sets save memory"""
+
+    def __init__(self, iterable: Iterable[int] = ()) -> None:
+        self.data = bytearray()
+        data = self.data
+        for number in iterable:  # Same as add, inlined as it runs for every number
+            if number < 0:
+                raise ValueError(f"Only non-negative integers are allowed, not {number}")
+            index = number >> 3
+            if index >= len(data):
+                data.extend(bytes(index + 1 - len(data)))
+            data[index] |= 1 << (number & 7)
+
+    @classmethod
+    def _from_int(cls, value: int) -> "BitSet":
+        result = cls()
+        result.data = bytearray(value.to_bytes((value.bit_length() + 7) // 8, "little"))
+        return result
+
+    def __int__(self) -> int:
+        return int.from_bytes(self.data, "little")
+
+    @staticmethod
+    def _coerce(other: Iterable[int]) -> "BitSet":
+        return other if isinstance(other, BitSet) else BitSet(other)
+
+    @staticmethod
+    def _split(other: Iterable[object]) -> Tuple["BitSet", bool]:
+        """Elements of other a BitSet can hold, and whether other has any more
+
+        Negative numbers and non-integers cannot be in a BitSet, comparisons treat
+        them as not in self instead of raising, like set and frozenset do.
+        """
+        if isinstance(other, BitSet):
+            return other, False
+        elements = other if isinstance(other, Set) else list(other)  # May be single use
+        try:
+            return BitSet(elements), False
+        except (TypeError, ValueError):  # Slow path, only with elements outside
+            inside = BitSet(element for element in elements if isinstance(element, int) and element >= 0)
+            return inside, True
+
+    def __contains__(self, number: object) -> bool:
+        if not isinstance(number, int) or number < 0 or number >> 3 >= len(self.data):
+            return False
+        return bool(self.data[number >> 3] >> (number & 7) & 1)
+
+    def __len__(self) -> int:
+        return bin(int(self)).count("1")  # int.bit_count() in Python 3.10+
+
+    def __iter__(self) -> Iterator[int]:
+        for index, byte in enumerate(self.data):
+            if byte:
+                for bit in BIT_POSITIONS[byte]:
+                    yield index * 8 + bit
+
+    def __repr__(self) -> str:
+        return f"BitSet({set(self)})" if self else "BitSet()"
+
+    def add(self, number: int) -> None:
+        if number < 0:
+            raise ValueError(f"Only non-negative integers are allowed, not {number}")
+        index = number >> 3
+        if index >= len(self.data):
+            self.data.extend(bytes(index + 1 - len(self.data)))
+        self.data[index] |= 1 << (number & 7)
+
+    def discard(self, number: int) -> None:
+        if number in self:
+            self.data[number >> 3] &= ~(1 << (number & 7))
+
+    def memoryview(self) -> memoryview:
+        """Bytes of the set without copying them, the set cannot grow while in use"""
+        return memoryview(self.data)
+
+    # Operators, the other operand must be a set like with set and frozenset
+
+    def __and__(self, other: Set) -> "BitSet":
+        if not isinstance(other, Set):
+            return NotImplemented
+        return BitSet._from_int(int(self) & int(self._split(other)[0]))
+
+    def __or__(self, other: Set) -> "BitSet":
+        if not isinstance(other, Set):
+            return NotImplemented
+        return BitSet._from_int(int(self) | int(self._coerce(other)))
+
+    def __xor__(self, other: Set) -> "BitSet":
+        if not isinstance(other, Set):
+            return NotImplemented
+        return BitSet._from_int(int(self) ^ int(self._coerce(other)))
+
+    def __sub__(self, other: Set) -> "BitSet":
+        if not isinstance(other, Set):
+            return NotImplemented
+        return BitSet._from_int(int(self) & ~int(self._split(other)[0]))
+
+    __rand__, __ror__, __rxor__ = __and__, __or__, __xor__
+
+    def __rsub__(self, other: Set) -> "BitSet":
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self._coerce(other) - self
+
+    def _update(self, result: "BitSet") -> "BitSet":
+        """Replace the bytes in place, views stay correct or growing raises BufferError like add"""
+        data = result.data
+        if len(data) < len(self.data):
+            data.extend(bytes(len(self.data) - len(data)))  # Never shrink, trailing zeros are empty
+        self.data[:] = data
+        return self
+
+    def __iand__(self, other: Set) -> "BitSet":
+        return self._update(self & other)
+
+    def __ior__(self, other: Set) -> "BitSet":
+        return self._update(self | other)
+
+    def __ixor__(self, other: Set) -> "BitSet":
+        return self._update(self ^ other)
+
+    def __isub__(self, other: Set) -> "BitSet":
+        return self._update(self - other)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Set):
+            return NotImplemented
+        inside, outside = self._split(other)
+        return not outside and int(self) == int(inside)
+
+    def __le__(self, other: Set) -> bool:
+        if not isinstance(other, Set):
+            return NotImplemented
+        return int(self) & ~int(self._split(other)[0]) == 0
+
+    def __lt__(self, other: Set) -> bool:
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self <= other and self != other
+
+    def __ge__(self, other: Set) -> bool:
+        if not isinstance(other, Set):
+            return NotImplemented
+        inside, outside = self._split(other)
+        return not outside and inside <= self
+
+    def __gt__(self, other: Set) -> bool:
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self >= other and self != other
+
+    # Methods, the other operand can be any iterable like with set and frozenset
+
+    def isdisjoint(self, other: Iterable[int]) -> bool:
+        return int(self) & int(self._split(other)[0]) == 0
+
+    def issubset(self, other: Iterable[int]) -> bool:
+        return self <= self._split(other)[0]
+
+    def issuperset(self, other: Iterable[int]) -> bool:
+        inside, outside = self._split(other)
+        return not outside and self >= inside
+
+    def union(self, other: Iterable[int]) -> "BitSet":
+        return self | self._coerce(other)
+
+    def intersection(self, other: Iterable[int]) -> "BitSet":
+        return self & self._split(other)[0]
+
+    def difference(self, other: Iterable[int]) -> "BitSet":
+        return self - self._split(other)[0]
+
+    def symmetric_difference(self, other: Iterable[int]) -> "BitSet":
+        return self ^ self._coerce(other)
+
+
+bit_set = BitSet({1, 2, 2, 2, 3, 4})  # => BitSet({1, 2, 3, 4})
+bit_set.add(5)                        # => BitSet({1, 2, 3, 4, 5})
+bit_set.discard(7)                    # => BitSet({1, 2, 3, 4, 5})
+bytes(bit_set.memoryview())           # => b'>' The bits 00111110
+# bit_set.add(-1)                     # => Error | Only non-negative integers
+
+assert bit_set & other_set == some_set & other_set == {3, 4, 5}
+assert bit_set | other_set == some_set | other_set
+assert bit_set - other_set == some_set - other_set
+assert bit_set ^ other_set == some_set ^ other_set
+assert other_set - bit_set == other_set - some_set
+assert bit_set.union(range(3, 7)) == some_set.union(range(3, 7))
+assert bit_set.isdisjoint(extra_set) and not bit_set.isdisjoint(other_set)
+assert BitSet(subset) <= bit_set and BitSet(subset).issubset(some_set)
+assert BitSet(proper_subset) < bit_set and not BitSet(subset) < bit_set
+assert BitSet(proper_superset) > bit_set and BitSet(superset).issuperset(some_set)
+assert list(bit_set) == sorted(some_set) and len(bit_set) == len(some_set)
+
+# Elements a BitSet cannot hold are not in it, comparisons do not raise
+assert BitSet({1}) != {-1} and BitSet({1}) != {1, "a"} and BitSet({1}) in [{-1}, {1}]
+assert BitSet({1}) <= {1, -1} and not BitSet({1}) >= {1, -1} and BitSet({1}) < {1, -1}
+assert bit_set.isdisjoint([-1, "a"]) and bit_set & {-1, 1} == {1} and bit_set - {-1, 1} == {2, 3, 4, 5}
+assert bit_set.issubset(iter([-1, *some_set])) and not bit_set.issuperset([-1])
+
+# In place operators keep the same buffer, a view sees the result or growing raises
+in_place = BitSet({1, 20})
+view = in_place.memoryview()
+in_place &= {1, 5}
+in_place |= {2}
+assert in_place == {1, 2} and view[0] == 0b110 and int.from_bytes(view, "little") == int(in_place)
+in_place ^= {1, 3}
+in_place -= {3}
+assert in_place == {2} and bytes(view) == bytes(in_place.data)
+# in_place |= {100}                   # => BufferError | The view is still in use
+view.release()
+in_place |= {100}
+assert in_place == {2, 100}
+
+
+# Memory and speed with 10_000_000 elements, run with BENCHMARK=1
+
+import sys
+
+from performance import RUN_BENCHMARKS, benchmark
+
+if RUN_BENCHMARKS:
+    even_numbers, multiples_of_3 = range(0, 2 * 10**7, 2), range(0, 2 * 10**7, 3)
+    left, right = set(even_numbers), set(multiples_of_3)
+    left_bits, right_bits = BitSet(even_numbers), BitSet(multiples_of_3)
+
+    set_memory = sys.getsizeof(left) + sum(map(sys.getsizeof, left))  # Table and ints
+    print(f"set: {set_memory / 1024**2:.1f} MB | BitSet: {sys.getsizeof(left_bits.data) / 1024**2:.1f} MB")
+
+    benchmark({
+        "set": lambda: (left & right, left | right, left - right, left ^ right, left <= right),
+        "BitSet": lambda: (
+            left_bits & right_bits,
+            left_bits | right_bits,
+            left_bits - right_bits,
+            left_bits ^ right_bits,
+            left_bits <= right_bits,
+        ),
+    })
+    del left, right, left_bits, right_bits
+
+# Results for &, |, -, ^ and <=
+# set: 523.0 MB | BitSet: 2.4 MB
+#    set: 1.686s
+# BitSet: 0.027s
+
 ####################################################
 # 2.5 Frozensets | Sets but immutable
 ####################################################
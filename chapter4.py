@@ -72,6 +72,92 @@ assert exists_offer
 assert amount == 0.09
 
 
+# Pricing rules over whole columns
+
+# Reference: https://docs.python.org/3/library/array.html
+# Reference: https://numpy.org/doc/stable/reference/generated/numpy.where.html
+
+# Prices are stored in an array of floats, 8 bytes each instead of a Python
+# object per price. Each rule returns a new array. When NumPy is installed the
+# rules run in C over the same buffer, otherwise a comprehension converts every
+# price back to a Python float: that fallback saves memory only, it is slower
+# than the loop it replaces. The asserts below check whichever one runs.
+
+from array import array
+
+from performance import numpy, to_array  # numpy is None when not installed
+
+
+def discount_loop(prices: List[float], threshold: float = 8.0, factor: float = 0.8) -> List[float]:
+    """Reference implementation, the loop from chapter 3"""
+    prices = list(prices)
+    for index, price in enumerate(prices):
+        if price <= threshold:
+            continue
+
+        prices[index] *= factor
+    return prices
+
+
+def apply_discount(prices: array, threshold: float = 8.0, factor: float = 0.8) -> array:
+    if numpy is not None:
+        column = numpy.frombuffer(prices)
+        return to_array(numpy.where(column > threshold, column * factor, column))
+    return array("d", [price * factor if price > threshold else price for price in prices])
+
+
+def find_discounted(prices: array, limit: float = 3) -> Tuple[bool, float]:
+    """Same as is_discounted but over a column"""
+    lowest_price = numpy.frombuffer(prices).min() if numpy is not None else min(prices)
+    return bool(lowest_price < limit), float(lowest_price)
+
+
+def increase_prices(prices: array, percentage_increase: float) -> array:
+    factor = 1 + percentage_increase / 100
+    if numpy is not None:
+        return to_array(numpy.frombuffer(prices) * factor)
+    return array("d", [price * factor for price in prices])
+
+
+price_column = array("d", prices)
+
+assert find_discounted(price_column) == is_discounted(prices)
+assert list(apply_discount(price_column)) == discount_loop(prices)
+assert list(increase_prices(price_column, 10)) == [price * 1.1 for price in prices]
+apply_discount(price_column)[4]  # => 7.288 (9.11 * 0.8)
+
+
+# Benchmark with 10_000_000 prices
+
+import random
+
+from performance import RUN_BENCHMARKS, benchmark
+
+if RUN_BENCHMARKS:
+    random.seed(42)
+    many_prices = [random.uniform(0, 10) for _ in range(10_000_000)]
+    many_prices_column = array("d", many_prices)
+
+    benchmark({
+        "Loop": lambda: discount_loop(many_prices),
+        "Column": lambda: apply_discount(many_prices_column),
+        "Minimum (list)": lambda: is_discounted(many_prices),
+        "Minimum (column)": lambda: find_discounted(many_prices_column),
+    })
+    del many_prices, many_prices_column
+
+# Results without NumPy installed, 320 MB for the list and 80 MB for the column
+#             Loop: 0.377s
+#           Column: 0.553s
+#   Minimum (list): 0.110s
+# Minimum (column): 0.158s
+# Results with NumPy installed, in a slower machine than the ones above
+#             Loop: 0.851s
+#           Column: 0.272s
+#   Minimum (list): 0.275s
+# Minimum (column): 0.008s
+
+
 ####################################################
 # 4.1 Arbitrary parameters
 ####################################################
@@ -102,6 +188,112 @@ assert summation(*numbers) == 10
 assert concatenate(**words) == "Hello World"
 
 
+# Summing many values without unpacking them
+
+# Reference: https://docs.python.org/3/library/math.html#math.fsum
+
+# summation(*values) first copies every value into a tuple. sum_values takes
+# the iterable or buffer (array, bytes, memoryview) as it is and uses math.fsum,
+# which does not accumulate rounding errors like result += value does.
+# With an executor the values are split in chunks summed in parallel. Each chunk
+# returns its sum and the rounding error of that sum, so combining the chunks
+# keeps the accuracy of fsum.
+
+import math
+from array import array
+from concurrent.futures import Executor, Future
+from collections import deque
+from itertools import chain, islice
+from typing import Deque, Iterable, Iterator, Optional, Union
+
+Numbers = Union[Iterable[float], memoryview, array]
+
+
+def sum_chunk(chunk: Union[List[float], array]) -> Tuple[float, float]:
+    high = math.fsum(chunk)
+    if not math.isfinite(high):  # inf - inf would raise, nothing was lost anyway
+        return high, 0.0
+    low = math.fsum(chain(chunk, (-high,)))  # What high lost when rounded
+    return high, low
+
+
+def chunks(values: Numbers, chunk_size: int) -> Iterator[Union[List[float], array]]:
+    try:
+        buffer = memoryview(values)
+    except TypeError:  # Not a buffer, any iterable
+        iterator = iter(values)
+        while chunk := list(islice(iterator, chunk_size)):
+            yield chunk
+        return
+    for start in range(0, len(buffer), chunk_size):
+        chunk = array(buffer.format)
+        chunk.frombytes(buffer[start : start + chunk_size].cast("B"))  # No float objects created
+        yield chunk
+
+
+def sum_values(
+    values: Numbers, executor: Optional[Executor] = None, chunk_size: int = 1_000_000, window: int = 4
+) -> float:
+    if executor is None:
+        return math.fsum(values)
+    partials: List[float] = []
+    pending: Deque[Future[Tuple[float, float]]] = deque()
+    for chunk in chunks(values, chunk_size):
+        if len(pending) == window:  # Bounds the memory used by chunks in flight
+            partials.extend(pending.popleft().result())
+        pending.append(executor.submit(sum_chunk, chunk))
+    for future in pending:
+        partials.extend(future.result())
+    return math.fsum(partials)
+
+
+assert sum_values(numbers) == summation(*numbers) == 10
+assert sum_values(iter(numbers)) == 10  # Any iterable, even single use ones
+assert sum_values(array("d", numbers)) == 10
+assert sum_values([0.1] * 10) == 1.0
+assert summation(*[0.1] * 10) == 0.9999999999999999  # Accumulated rounding errors
+assert sum_values([math.inf, 1.0]) == summation(math.inf, 1.0) == math.inf
+
+# fsum works with floats, integers are converted and big ones lose precision.
+# For integers sum (or summation) is exact, use it instead.
+assert sum_values([10**20, 1]) == 1e20 and summation(10**20, 1) == 10**20 + 1
+
+
+# The executor must be created under this guard, it starts new processes that
+# import this file again on Windows and macOS
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from operator import add
+
+from performance import RUN_BENCHMARKS, benchmark
+
+if __name__ == "__main__":
+    with ProcessPoolExecutor() as executor:
+        assert sum_values(array("d", [0.1] * 10), executor, chunk_size=3) == 1.0
+        assert sum_values(iter(numbers), executor, chunk_size=3) == 10
+        assert sum_values([math.inf, 1.0, -1.0], executor, chunk_size=2) == math.inf
+
+        if RUN_BENCHMARKS:
+            many_values = array("d", [0.1]) * 10**8  # 800 MB, 10**8 values
+            assert sum(many_values) == reduce(add, many_values) == 9999999.98112945
+            assert sum_values(many_values) == sum_values(many_values, executor) == 0.1 * 10**8
+            benchmark({
+                "reduce": lambda: reduce(add, many_values),
+                "sum": lambda: sum(many_values),
+                "sum_values": lambda: sum_values(many_values),
+                "sum_values with processes": lambda: sum_values(many_values, executor),
+            })
+            del many_values
+
+# Results in a machine with a single core, where processes only add the cost of
+# copying the chunks. Only fsum gets the exact result, 0.1 * 10**8.
+#                    reduce: 2.6s
+#                       sum: 0.6s
+#                sum_values: 1.2s
+# sum_values with processes: 4.4s
+
+
 ####################################################
 # 4.2 Higher order functions
 ####################################################
@@ -162,6 +354,80 @@ some_list: List[float] = [1, 2, 3, 4, 5, 6]
 assert apply(some_list, lambda x: x**2) == [1, 4, 9, 16, 25, 36]
 
 
+# Specialized functions, created once per exponent
+
+# Reference: https://docs.python.org/3/library/functools.html#functools.lru_cache
+
+# power(y) creates a new closure in every call and x**y is a general power.
+# specialized_power returns the same function for the same exponent and uses
+# cheaper operations for common exponents. Builtins such as math.sqrt or pow
+# with partial run without a Python frame per call.
+
+# For floats the cheaper operations are not always bit for bit equal to x**y:
+# x * x * x rounds twice and differs from x**3 in the last bit for about 1 in
+# 4 values, x * x differs from x**2 for about 1 in 1_000. Integers are exact.
+# Compare float results with math.isclose, the relative difference is below
+# 3e-16.
+
+import math
+import random
+from array import array
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def specialized_power(y: float) -> Callable[[float], float]:
+    if y == 2:
+        return lambda x: x * x
+    if y == 3:
+        return lambda x: x * x * x
+    if y == 0.5:
+        return math.sqrt  # Same result as x**0.5 but only for x >= 0
+    return partial(pow, exp=y)
+
+
+def apply_many(values: Iterable[float], y: float) -> array:
+    """Power of every value, stored in an array of floats instead of a list"""
+    return array("d", map(specialized_power(y), values))
+
+
+assert specialized_power(2) is specialized_power(2)  # Cached
+assert apply(some_list, specialized_power(2)) == [1, 4, 9, 16, 25, 36]
+assert apply(some_list, specialized_power(0.5)) == [x**0.5 for x in some_list]
+assert apply(some_list, specialized_power(1.5)) == [x**1.5 for x in some_list]
+assert list(apply_many(some_list, 2)) == [1, 4, 9, 16, 25, 36]
+assert list(apply_many(array("d", some_list), 3)) == [1, 8, 27, 64, 125, 216]
+
+random.seed(42)
+floats = [random.uniform(0, 10) for _ in range(1_000)]
+for y in (2, 3, 0.5, 1.5):
+    assert all(map(math.isclose, apply_many(floats, y), (x**y for x in floats)))
+assert specialized_power(3)(1.2) != 1.2**3  # 1.728 and 1.7279999999999998
+
+
+# Microbenchmark
+
+from performance import RUN_BENCHMARKS, benchmark
+
+if RUN_BENCHMARKS:
+    values = [float(value) for value in range(1_000_000)]
+    benchmark({
+        "Closure": lambda: list(map(power(2), values)),
+        "Partial": lambda: list(map(square_partial, values)),
+        "Lambda": lambda: list(map(lambda x: x**2, values)),
+        "Specialized": lambda: list(map(specialized_power(2), values)),
+        "apply_many": lambda: apply_many(values, 2),
+    })
+    del values
+
+# Results for squaring 1_000_000 values
+#     Closure: 0.164s
+#     Partial: 0.470s
+#      Lambda: 0.201s
+# Specialized: 0.111s
+#  apply_many: 0.125s  => Same calls, the array only saves memory
+
+
 ####################################################
 # 4.3 Common higher-order functions (map, filter reduce)
 ####################################################
@@ -177,6 +443,222 @@ sum_filtered: float = reduce(lambda x, y: x + y, squares_filtered)        # => 8
 assert sum_filtered == 86
 
 
+# Lazy pipelines
+
+# Reference: https://docs.python.org/3/library/itertools.html
+# Reference: https://docs.python.org/3/library/concurrent.futures.html
+
+# A Pipeline stores the stages and runs nothing until it is iterated or
+# reduced, one element at a time, so memory does not grow with the input.
+# Pipelines are immutable, each stage returns a new one.
+
+# When every stage is a map or a filter, reduce runs them fused: a single loop
+# is generated for that sequence of stages (like namedtuple generates classes),
+# which avoids passing each element through one iterator per stage.
+
+from collections import deque
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Deque, Iterable
+
+Stage = Tuple[str, Any]  # ("map", function), ("take", 3), ("parallel", (executor, chunk_size, window))
+
+MISSING = object()
+
+
+@lru_cache(maxsize=None)
+def fused_loop(kinds: Tuple[str, ...], collect: bool) -> Callable[..., Any]:
+    """Loop applying map and filter stages, generated once per sequence of kinds"""
+    names = [f"function_{index}" for index in range(len(kinds))]
+    lines = ["def loop(source, functions, reducer, accumulator, missing):"]
+    if names:
+        lines.append(f"    {', '.join(names)}, = functions")
+    if collect:
+        lines.append("    append = accumulator.append")
+    lines.append("    for value in source:")
+    for kind, name in zip(kinds, names):
+        if kind == "map":
+            lines.append(f"        value = {name}(value)")
+        else:
+            lines.append(f"        if not {name}(value):")
+            lines.append("            continue")
+    if collect:
+        lines.append("        append(value)")
+    else:
+        lines.append("        if accumulator is missing:")
+        lines.append("            accumulator = value")
+        lines.append("        else:")
+        lines.append("            accumulator = reducer(accumulator, value)")
+    lines.append("    return accumulator")
+    namespace: Dict[str, Any] = {}
+    exec("\n".join(lines), namespace)
+    return namespace["loop"]
+
+
+def run_chunk(stages: Tuple[Stage, ...], chunk: List[Any]) -> List[Any]:
+    """Runs in the worker processes, the functions must be importable"""
+    loop = fused_loop(tuple(kind for kind, _ in stages), collect=True)
+    return loop(chunk, [function for _, function in stages], None, [], MISSING)
+
+
+def parallel_chunks(
+    source: Iterable[Any], stages: Tuple[Stage, ...], executor: Executor, chunk_size: int, window: int
+) -> Iterator[Any]:
+    iterator = iter(source)
+    pending: Deque[Future[List[Any]]] = deque()
+    while True:
+        while len(pending) < window and (chunk := list(islice(iterator, chunk_size))):
+            pending.append(executor.submit(run_chunk, stages, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()  # Keeps the order of the source
+
+
+def batches(iterable: Iterable[Any], size: int) -> Iterator[Tuple[Any, ...]]:
+    iterator = iter(iterable)
+    while batch := tuple(islice(iterator, size)):
+        yield batch
+
+
+def windows(iterable: Iterable[Any], size: int) -> Iterator[Tuple[Any, ...]]:
+    window: Deque[Any] = deque(maxlen=size)
+    for value in iterable:
+        window.append(value)
+        if len(window) == size:
+            yield tuple(window)
+
+
+@dataclass(frozen=True)
+class Pipeline:
+    source: Iterable[Any]
+    stages: Tuple[Stage, ...] = ()
+
+    def _then(self, kind: str, argument: Any) -> "Pipeline":
+        return Pipeline(self.source, self.stages + ((kind, argument),))
+
+    def map(self, function: Callable[[Any], Any]) -> "Pipeline":
+        return self._then("map", function)
+
+    def filter(self, predicate: Callable[[Any], bool]) -> "Pipeline":
+        return self._then("filter", predicate)
+
+    where = filter  # Reads better in queries: .map(price).where(is_cheap)
+
+    def batch(self, size: int) -> "Pipeline":
+        return self._then("batch", size)
+
+    def window(self, size: int) -> "Pipeline":
+        return self._then("window", size)
+
+    def take(self, count: int) -> "Pipeline":
+        return self._then("take", count)
+
+    def parallel(self, executor: Executor, chunk_size: int = 10_000, window: int = 4) -> "Pipeline":
+        """The previous stages run in the executor, at most window chunks at a time"""
+        _, stages = self._started()
+        if any(kind not in ("map", "filter") for kind, _ in stages):
+            raise ValueError("Only map and filter stages can run in parallel")
+        return self._then("parallel", (executor, chunk_size, window))
+
+    def _started(self) -> Tuple[Iterable[Any], Tuple[Stage, ...]]:
+        """Source with the parallel stages applied and the stages after the last one
+
+        A new parallel_chunks generator is created on every call, nothing runs
+        until it is iterated, so pipelines with parallel stages can be reused too.
+        """
+        source: Iterable[Any] = self.source
+        stages: Tuple[Stage, ...] = ()
+        for kind, argument in self.stages:
+            if kind == "parallel":
+                executor, chunk_size, window = argument
+                source, stages = parallel_chunks(source, stages, executor, chunk_size, window), ()
+            else:
+                stages += ((kind, argument),)
+        return source, stages
+
+    def __iter__(self) -> Iterator[Any]:
+        source, stages = self._started()
+        iterator = iter(source)
+        for kind, argument in stages:
+            if kind == "map":
+                iterator = map(argument, iterator)
+            elif kind == "filter":
+                iterator = filter(argument, iterator)
+            elif kind == "batch":
+                iterator = batches(iterator, argument)
+            elif kind == "window":
+                iterator = windows(iterator, argument)
+            else:
+                iterator = islice(iterator, argument)
+        return iterator
+
+    def reduce(self, function: Callable[[Any, Any], Any], initial: Any = MISSING, fused: bool = True) -> Any:
+        source, stages = self._started()
+        kinds = tuple(kind for kind, _ in stages)
+        if fused and all(kind in ("map", "filter") for kind in kinds):
+            loop = fused_loop(kinds, collect=False)
+            functions = [function for _, function in stages]
+            result = loop(source, functions, function, initial, MISSING)
+        else:
+            result = reduce(function, self) if initial is MISSING else reduce(function, self, initial)
+        if result is MISSING:
+            raise TypeError("reduce() of empty pipeline with no initial value")
+        return result
+
+    def sum(self) -> float:
+        return self.reduce(add, 0)
+
+
+def pipeline(iterable: Iterable[Any]) -> Pipeline:
+    return Pipeline(iterable)
+
+
+def greater_than_5(x: float) -> bool:
+    return x > 5
+
+
+some_list: List[float] = [1, 2, 3, 4, 5, 6]
+squares_pipeline = Pipeline(some_list).map(square)
+sum_filtered: float = squares_pipeline.filter(greater_than_5).reduce(lambda x, y: x + y)  # => 86
+
+assert sum_filtered == 86
+assert Pipeline(some_list).map(square).filter(greater_than_5).reduce(lambda x, y: x + y, fused=False) == 86
+assert list(squares_pipeline) == [1, 4, 9, 16, 25, 36]  # Pipelines can be reused
+assert list(squares_pipeline.batch(4)) == [(1, 4, 9, 16), (25, 36)]
+assert list(squares_pipeline.window(3).take(2)) == [(1, 4, 9), (4, 9, 16)]
+assert Pipeline(some_list).filter(lambda x: x > 10).reduce(lambda x, y: x + y, 0) == 0
+assert pipeline(some_list).map(square).where(greater_than_5).sum() == 86
+# Pipeline([]).reduce(lambda x, y: x + y)  # => TypeError like functools.reduce
+
+
+import resource
+import time
+
+if __name__ == "__main__":
+    with ProcessPoolExecutor() as executor:  # square from 4.2 is picklable, lambdas are not
+        squares_in_parallel = Pipeline(range(1, 7)).map(square).parallel(executor, chunk_size=2)
+        assert squares_in_parallel.filter(greater_than_5).reduce(add) == 86
+        assert list(squares_in_parallel) == list(squares_in_parallel) == [1, 4, 9, 16, 25, 36]
+
+# 10**8 elements in constant memory, the range is never materialized
+if RUN_BENCHMARKS:
+    for name, run in [
+        ("Stages", lambda: Pipeline(range(10**8)).map(square).filter(greater_than_5).reduce(add, fused=False)),
+        ("Fused", lambda: Pipeline(range(10**8)).map(square).filter(greater_than_5).reduce(add)),
+    ]:
+        peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        run()
+        growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_before) / 1024
+        print(f"{name}: {time.perf_counter() - start:.1f}s | peak memory growth {growth:.0f} MB")
+
+# Results
+# Stages: 12.6s | peak memory growth 0 MB
+# Fused: 10.3s | peak memory growth 0 MB
+
+
 ####################################################
 # 4.4 Comprehensions
 ####################################################
@@ -194,6 +676,52 @@ sum_filtered: float = summation(*[square_power(x) for x in some_list if square_p
 assert sum_filtered == 86
 
 
+# Calling square_power once per element
+
+# The comprehension above calls square_power twice for the values that pass the
+# filter and builds a list before summing. A pipeline calls it once and adds the
+# values as they come, without storing them.
+
+calls: List[float] = []
+
+
+def square_power_logged(x: float) -> float:
+    calls.append(x)
+    return square_power(x)
+
+
+sum_filtered: float = pipeline(some_list).map(square_power_logged).where(lambda v: v > 5).sum()
+
+assert sum_filtered == 86
+assert calls == some_list  # Once per element
+
+calls.clear()
+summation(*[square_power_logged(x) for x in some_list if square_power_logged(x) > 5])
+assert len(calls) == 10  # 6 for the filter and 4 more for the values kept
+
+
+# Benchmark with 1_000_000 elements
+
+from performance import RUN_BENCHMARKS, benchmark, traced_memory
+
+if RUN_BENCHMARKS:
+    many_elements = range(1_000_000)
+    cases = {
+        "Comprehension": lambda: summation(*[square_power(x) for x in many_elements if square_power(x) > 5]),
+        "Pipeline": lambda: pipeline(many_elements).map(square_power).where(lambda v: v > 5).sum(),
+    }
+
+    benchmark(cases)
+    for name, case in cases.items():
+        print(f"{name} peak memory: {traced_memory(case)[2] / 1024**2:.1f} MB")
+
+# Results
+# Comprehension: 0.150s
+#      Pipeline: 0.110s
+# Comprehension peak memory: 46.2 MB
+# Pipeline peak memory: 0.0 MB
+
+
 # Code equivalent using a FOR loop
 
 result: float = 0
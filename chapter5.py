@@ -93,7 +93,7 @@ assert temperature_today.farenheit_to_celcius(95) == 35  # Invocation from insta
 ####################################################
 
 
-from typing import ClassVar
+from typing import ClassVar, Tuple
 from dataclasses import dataclass, field
 import uuid
 
@@ -138,7 +138,7 @@ class PersonDataClass:
 
     def __post_init__(self):
         self.member_id: str = f"{self.name[0].upper()}-{str(uuid.uuid4())[:8]}"
-        self.personal_id = str(PersonDataClass._get_next_personal_id()).zfill(8)
+        self.personal_id = str(type(self)._get_next_personal_id()).zfill(8)  # Also for PersonSlotted
 
     def is_old_enough(self) -> bool:
         return self.age >= 18
@@ -154,6 +154,75 @@ peter.is_old_enough()  # => True
 PersonDataClass("Julia", 16, "M", 65, 162.4).is_old_enough()  # => False
 print(peter) # => PersonaDataClass(name='Peter', age=18, gender='H', weight=85, height=175.9, properties=[], member_id='P-f642581c', dni='00000001')
 
+
+# Using __slots__ to save memory
+
+# Reference: https://docs.python.org/3/library/dataclasses.html#dataclasses.dataclass
+# Reference: https://docs.python.org/3/reference/datamodel.html#slots
+
+# __slots__ stores the attributes in fixed places instead of a per-instance
+# __dict__. Instances are smaller and attribute access is faster, which matters
+# when millions of them are created. The constructor and the methods stay the
+# same but new attributes cannot be added.
+
+# Python 3.10+ has @dataclass(slots=True). In Python 3.9 __slots__ can be
+# written in the class body only when no field has a default value, slotted
+# recreates the class with __slots__ for the rest of the cases. Called with a
+# name it keeps the original class and returns a slotted copy.
+
+from performance import slotted
+
+PersonSlotted = slotted(PersonDataClass, "PersonSlotted")  # Same fields and methods
+
+mary = PersonSlotted("Mary", 18, "M", 60, 165.2)
+mary.is_old_enough()  # => True
+mary.age = 19         # => No Error - Attributes are still mutable
+# mary.nickname = "M" # => Error - No __dict__ to add new attributes
+
+assert not hasattr(mary, "__dict__")
+assert PersonDataClass._personal_id == 2  # PersonSlotted counts in its own copy
+
+
+# Frozen and slotted, instances are hashable and cannot be modified
+
+from dataclasses import replace
+
+
+@slotted
+@dataclass(frozen=True)
+class PersonFrozen:
+    name: str
+    age: int
+    gender: str
+    weight: float
+    height: float
+    properties: List[str] = field(default_factory=list, hash=False)  # Lists are not hashable
+    member_id: str = field(init=False)
+    personal_id: str = field(init=False)
+    _personal_id: ClassVar[int] = 0
+
+    def __post_init__(self):
+        # Frozen instances can only be initialized through object.__setattr__
+        object.__setattr__(self, "member_id", f"{self.name[0].upper()}-{str(uuid.uuid4())[:8]}")
+        object.__setattr__(self, "personal_id", str(PersonFrozen._get_next_personal_id()).zfill(8))
+
+    def is_old_enough(self) -> bool:
+        return self.age >= 18
+
+    @classmethod
+    def _get_next_personal_id(cls) -> int:
+        cls._personal_id += 1
+        return cls._personal_id
+
+
+anna = PersonFrozen("Anna", 17, "M", 55, 160.1)
+anna.is_old_enough()  # => False
+# anna.age = 18       # => Error - FrozenInstanceError
+older_anna = replace(anna, age=18)  # Returns a copy with the changes
+
+assert older_anna.is_old_enough()
+assert anna in {anna, older_anna}  # Hashable, can be used in sets and dicts
+
 ####################################################
 # 5.5 Operator Overloading
 ####################################################
@@ -161,7 +230,8 @@ print(peter) # => PersonaDataClass(name='Peter', age=18, gender='H', weight=85,
 
 # Reference: https://docs.python.org/3/reference/datamodel.html#basic-customization
 
-from typing import List, Optional  
+from itertools import count
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 @dataclass
@@ -169,7 +239,7 @@ class Article:
     name: str
 
     def __eq__(self, other: object) -> bool:
-        if not isinstance(other, Article):
+        if not isinstance(other, type(self)):  # Also works for ArticleSlotted
             raise NotImplementedError()
 
         return self.name == other.name
@@ -181,34 +251,86 @@ class Article:
         return self.name
 
     def __repr__(self) -> str:
-        return f"Article('{self.name}')"
+        return f"{type(self).__name__}('{self.name}')"
+
+
+ArticleSlotted = slotted(Article, "ArticleSlotted")  # Same methods, no __dict__, see PersonSlotted
+
+assert ArticleSlotted("pen") == ArticleSlotted("pen")
+assert repr(ArticleSlotted("pen")) == "ArticleSlotted('pen')"
+assert not hasattr(ArticleSlotted("pen"), "__dict__")
 
 
-@dataclass
 class ShoppingCart:
-    articles: List[Article] = field(default_factory=list)
+    """Multiset of articles, each unit keeps its place in the insertion order
+
+    Units are stored in an ordered dict by a unit id and indexed by article, so
+    adding and removing are O(1) per unit and equality compares a hash kept up
+    to date before comparing the articles. articles is a read-only tuple, carts
+    change only through add, remove and +=.
+    """
+
+    def __init__(self, articles: Iterable[Article] = ()) -> None:
+        self._units: Dict[int, Article] = {}  # Insertion order of every unit
+        self._unit_ids: Dict[Article, List[int]] = {}
+        self._next_id = count()
+        self._hash = 0  # XOR of the hashes of the different articles
+        for article in articles:
+            self._add(article)
+
+    def _add(self, article: Article) -> None:
+        if article not in self._unit_ids:
+            self._unit_ids[article] = []
+            self._hash ^= hash(article)
+        unit_id = next(self._next_id)
+        self._units[unit_id] = article
+        self._unit_ids[article].append(unit_id)
+
+    @property
+    def articles(self) -> Tuple[Article, ...]:
+        return tuple(self._units.values())
 
     def add(self, article: Article) -> ShoppingCart:
-        self.articles.append(article)
+        self._add(article)
         return self
 
     def remove(self, remove_article: Article) -> ShoppingCart:
-        self.articles = [article for article in self.articles if article != remove_article]
+        unit_ids = self._unit_ids.pop(remove_article, [])  # Removes every unit
+        if unit_ids:
+            self._hash ^= hash(remove_article)
+        for unit_id in unit_ids:
+            del self._units[unit_id]
         return self
 
+    def __iter__(self) -> Iterator[Article]:
+        return iter(self._units.values())
+
+    def __len__(self) -> int:
+        return len(self._units)
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, ShoppingCart):
             raise NotImplementedError()
-        return set(self.articles) == set(other.articles)
+        if self._hash != other._hash or len(self._unit_ids) != len(other._unit_ids):
+            return False
+        return self._unit_ids.keys() == other._unit_ids.keys()
 
     def __str__(self) -> str:
-        return str(self.articles)
+        return str(list(self))
 
     def __repr__(self) -> str:
-        return f"ShoppingCart({self.articles})"
+        return f"ShoppingCart({list(self)})"
 
     def __add__(self, other: ShoppingCart) -> ShoppingCart:
-        return ShoppingCart(self.articles + other.articles)
+        combined = ShoppingCart()
+        combined += self
+        combined += other
+        return combined
+
+    def __iadd__(self, other: ShoppingCart) -> ShoppingCart:
+        for article in list(other):  # Copied first, cart += cart is allowed
+            self._add(article)
+        return self
 
 
 apple = Article("Apple")
@@ -240,6 +362,18 @@ combined = ShoppingCart().add(apple) + ShoppingCart().add(pear)
 assert combined == ShoppingCart().add(apple).add(pear)  # => True
 print(combined)  # => ['Apple', 'Pear']
 
+# In place sum test, the left cart is updated without copying it
+cart = ShoppingCart().add(apple)
+cart += ShoppingCart().add(pear).add(apple)
+assert cart == ShoppingCart([apple, pear])
+print(cart)  # => ['Apple', 'Pear', 'Apple'], in the order the units were added
+print(len(cart))  # => 3
+assert list(cart) == [apple, pear, apple]
+
+# articles is a tuple now, cart.articles.append(tv) raises AttributeError
+# instead of changing a copy, use cart.add(tv)
+assert cart.articles == (apple, pear, apple)
+
 
 ####################################################
 # 5.6 Instances as Functions (__call__)
@@ -318,7 +452,7 @@ class Product:
 from copy import deepcopy  # Standard Library
 
 
-def update_price(products: List[Product], percentage_increase: float) -> List[Product]:
+def update_price_deepcopy(products: List[Product], percentage_increase: float) -> List[Product]:
     new: List[Product] = []
     for product in deepcopy(products):
         product.price *= 1 + percentage_increase / 100
@@ -326,6 +460,22 @@ def update_price(products: List[Product], percentage_increase: float) -> List[Pr
     return new
 
 
+# Copying only what changes
+
+# Reference: https://docs.python.org/3/library/dataclasses.html#dataclasses.replace
+
+# deepcopy copies every field of every product. replace creates a new Product
+# with the new price and shares the rest of the fields, which is safe because
+# strings are immutable. The original products are not modified either way.
+
+from dataclasses import replace
+
+
+def update_price(products: List[Product], percentage_increase: float) -> List[Product]:
+    factor = 1 + percentage_increase / 100
+    return [replace(product, _price=product.price * factor) for product in products]
+
+
 names = ["sheet", "speaker", "computer", "cup", "bottle", "cellular"]
 prices = [10.25, 5.258, 350.159, 25.99, 18.759, 215.231]
 
@@ -339,6 +489,87 @@ updated_prices: List[float] = [product.price for product in updated_products]
 print(out_of_date_prices)  # => [10.25, 5.26, 350.16, 25.99, 18.76, 215.23]
 print(updated_prices)  # => [11.28, 5.79, 385.18, 28.59, 20.64, 236.75]
 
+assert update_price(products, percentage_increase) == update_price_deepcopy(products, percentage_increase)
+assert updated_products[0]._name is products[0]._name  # Shared, not copied
+
+
+ProductSlotted = slotted(Product, "ProductSlotted")  # Slots "_name" and "_price", the properties use them
+
+slotted_products = [ProductSlotted(name, price) for name, price in zip(names, prices)]
+
+assert [product.price for product in slotted_products] == out_of_date_prices
+assert not hasattr(slotted_products[0], "__dict__")
+
+
+# Catalog with a price column
+
+# Reference: https://docs.python.org/3/library/array.html
+
+# For large catalogs the prices are stored together in an array of floats and
+# repriced in one pass. Each update returns a new catalog that shares the names
+# with the previous one, only the price column is new.
+
+from array import array
+
+
+@dataclass(frozen=True)
+class Catalog:
+    names: Tuple[str, ...]
+    prices: array  # array("d"), never modified after creation
+
+    @classmethod
+    def from_products(cls, products: Iterable[Product]) -> Catalog:
+        products = list(products)
+        return cls(
+            tuple(product._name for product in products),
+            array("d", (product._price for product in products)),
+        )
+
+    def update_price(self, percentage_increase: float) -> Catalog:
+        factor = 1 + percentage_increase / 100
+        # Same operations as the price property, rounding and then increasing
+        prices = array("d", [round(price, 2) * factor for price in self.prices])
+        return Catalog(self.names, prices)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> Product:
+        return Product(self.names[index], self.prices[index])
+
+    def __iter__(self) -> Iterator[Product]:
+        return map(Product, self.names, self.prices)
+
+
+catalog = Catalog.from_products(products)
+updated_catalog = catalog.update_price(percentage_increase)
+
+assert list(updated_catalog) == updated_products
+assert list(catalog) == products  # The previous version is unchanged
+assert updated_catalog.names is catalog.names
+print(updated_catalog[0])  # => Product(_name='sheet', _price=11.275)
+
+
+# Benchmark with 200_000 products
+
+from performance import RUN_BENCHMARKS, benchmark
+
+if RUN_BENCHMARKS:
+    many_products = [Product(f"product-{index}", index / 100) for index in range(200_000)]
+    many_products_catalog = Catalog.from_products(many_products)
+
+    benchmark({
+        "deepcopy": lambda: update_price_deepcopy(many_products, 10),
+        "replace": lambda: update_price(many_products, 10),
+        "catalog": lambda: many_products_catalog.update_price(10),
+    })
+    del many_products, many_products_catalog
+
+# Results
+# deepcopy: 0.976s
+#  replace: 0.259s
+#  catalog: 0.053s
+
 
 ####################################################
 # 5.8 Inheritance
@@ -0,0 +1,82 @@
+####################################################
+# Helpers shared by the performance examples
+####################################################
+
+# Benchmarks are slow and use a lot of memory, they only run when the BENCHMARK
+# environment variable is set, the chapters keep the measured results as
+# comments:
+#
+#     BENCHMARK=1 python chapter4.py
+
+from __future__ import annotations
+
+import os
+import time
+import tracemalloc
+from array import array
+from dataclasses import fields
+from typing import Any, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+try:
+    import numpy
+except ImportError:  # Optional, the standard library is used instead
+    numpy = None
+
+RUN_BENCHMARKS: bool = bool(os.environ.get("BENCHMARK"))
+
+
+def benchmark(cases: Dict[str, Callable[[], Any]]) -> Dict[str, float]:
+    """Runs every case once and prints how long it took"""
+    width = max(map(len, cases))
+    timings: Dict[str, float] = {}
+    for name, case in cases.items():
+        start = time.perf_counter()
+        case()
+        timings[name] = time.perf_counter() - start
+        print(f"{name:>{width}}: {timings[name]:.3f}s")
+    return timings
+
+
+def traced_memory(function: Callable[[], Any]) -> Tuple[Any, int, int]:
+    """Result of function and the bytes it allocated: still in use and at the peak"""
+    tracemalloc.start()
+    try:
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def to_array(values: numpy.ndarray) -> array:
+    """Copies a NumPy array of floats into an array("d")"""
+    result = array("d")
+    result.frombytes(values.tobytes())
+    return result
+
+
+T = TypeVar("T")
+
+
+def slotted(cls: Type[T], name: Optional[str] = None) -> Type[T]:
+    """Same as @dataclass(slots=True) of Python 3.10+, written above @dataclass
+
+    __slots__ cannot be written in the class body when fields have defaults, the
+    class is created again with __slots__ and without the defaults, which the
+    generated __init__ already knows. Called with a name it returns a slotted
+    copy with that name, next to the original: slotted(Article, "ArticleSlotted").
+
+    The methods are not recompiled, zero-argument super() in them still refers to
+    the original class and raises TypeError. @dataclass(slots=True) had the same
+    limitation before Python 3.14.
+    """
+    namespace = dict(cls.__dict__)
+    names = tuple(field.name for field in fields(cls))
+    namespace["__slots__"] = names
+    for field_name in names:
+        namespace.pop(field_name, None)
+    namespace.pop("__dict__", None)
+    namespace.pop("__weakref__", None)
+    if name is not None:
+        namespace["__qualname__"] = name
+    return type(cls)(name or cls.__name__, cls.__bases__, namespace)
@@ -0,0 +1,107 @@
+####################################################
+# Functions run by the process pools of chapter7
+####################################################
+
+# Process pools pickle functions by reference, module and name, and the worker
+# imports that module to find them, so they must be defined at the top level of
+# a module. Keeping them here lets chapter7 import them like any other helper.
+# This does not make spawned workers cheap: with the spawn start method (Windows
+# and macOS) every worker also runs the main script again, as __mp_main__,
+# wherever the function lives. Run as a script, chapter7 is run again in each
+# worker, only the code under its __main__ guards is skipped.
+
+from __future__ import annotations
+
+import time
+from array import array
+from itertools import compress
+from math import isqrt
+from typing import Any, Callable, Iterator, List, Tuple
+
+
+####################################################
+# Segmented Sieve of Eratosthenes, see 7.2
+####################################################
+
+SEGMENT_SIZE: int = 2**18  # Bytes per segment, small enough to fit in the CPU cache
+
+
+def small_primes(limit: int) -> List[int]:
+    """Primes smaller than or equal to limit using a plain Sieve of Eratosthenes"""
+    if limit < 2:
+        return []
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for candidate in range(2, isqrt(limit) + 1):
+        if sieve[candidate]:
+            multiples = range(candidate * candidate, limit + 1, candidate)
+            sieve[candidate * candidate :: candidate] = bytes(len(multiples))
+    return list(compress(range(limit + 1), sieve))
+
+
+def sieve_segment(low: int, high: int, base_primes: List[int]) -> bytearray:
+    """Flags with 1 the primes in [low, high), base_primes must reach sqrt(high)"""
+    segment = bytearray([1]) * (high - low)
+    for prime in base_primes:
+        if prime * prime >= high:
+            break
+        start = max(prime * prime, -(-low // prime) * prime)  # First multiple >= low
+        multiples = range(start - low, high - low, prime)
+        segment[start - low :: prime] = bytes(len(multiples))
+    if low < 2:
+        segment[: 2 - low] = bytes(min(2 - low, high - low))  # 0 and 1 are not primes
+    return segment
+
+
+def segment_bounds(start: int, number: int, segment_size: int) -> Iterator[Tuple[int, int]]:
+    for low in range(max(start, 2), number, segment_size):
+        yield low, min(low + segment_size, number)
+
+
+worker_base_primes: List[int] = []  # One copy per worker process
+
+
+def initialize_sieve_worker(limit: int) -> None:
+    global worker_base_primes
+    worker_base_primes = small_primes(limit)
+
+
+def primes_in_segment(bounds: Tuple[int, int]) -> array:
+    low, high = bounds
+    flags = sieve_segment(low, high, worker_base_primes)
+    return array("Q", compress(range(low, high), flags))  # Compact to send back
+
+
+def count_primes_in_segment(bounds: Tuple[int, int]) -> int:
+    low, high = bounds
+    return sieve_segment(low, high, worker_base_primes).count(1)  # Only an int is sent back
+
+
+####################################################
+# Executor pools, see 7.5
+####################################################
+
+
+def timed_call(
+    function: Callable[..., Any], submitted: float, *args: Any, **kwargs: Any
+) -> Tuple[Any, float]:
+    """Runs in the worker, returns the result and how long it waited in the queue"""
+    waited = time.perf_counter() - submitted  # Monotonic clock shared by processes
+    return function(*args, **kwargs), waited
+
+
+def measured_call(function: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, float]:
+    """Runs in the worker, returns the result and its CPU time / wall time ratio"""
+    cpu_start, wall_start = time.thread_time(), time.perf_counter()
+    result = function(*args, **kwargs)
+    wall = time.perf_counter() - wall_start
+    return result, (time.thread_time() - cpu_start) / wall if wall else 1.0
+
+
+def count_primes(number: int) -> int:  # CPU-bound
+    base_primes = small_primes(isqrt(max(number - 1, 0)))
+    return sum(
+        1
+        for low, high in segment_bounds(2, number, SEGMENT_SIZE)
+        for _ in compress(range(low, high), sieve_segment(low, high, base_primes))
+    )